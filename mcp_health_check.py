@@ -11,10 +11,20 @@ This script properly connects to the NASA Astronomy Picture of the Day MCP serve
 import sys
 import json
 import requests
+from requests.adapters import HTTPAdapter
 import argparse
 from typing import Dict, Any
 import uuid
 
+# Shared session with a tuned connection pool so repeated health-check
+# requests reuse the same keep-alive socket instead of paying a fresh
+# TCP+TLS handshake per call.
+_session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=50, pool_maxsize=100, max_retries=0)
+_session.mount("https://", _adapter)
+_session.mount("http://", _adapter)
+_session.headers.update({"User-Agent": "nasa-apod-mcp/1.0"})
+
 def create_mcp_session(base_url: str) -> Dict[str, Any]:
     """Create an MCP session and return session info"""
     # Generate a session ID
@@ -39,7 +49,7 @@ def send_mcp_request(session: Dict[str, Any], method: str, params: Dict = None)
     }
     
     try:
-        response = requests.post(
+        response = _session.post(
             f"{session['base_url']}/mcp/",
             json=request_data,
             headers=session['headers'],